@@ -1,10 +1,67 @@
 import os
-import tempfile # For creating temporary directories
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from ocr_utils import (
-    process_large_pdf
+    process_large_pdf,
+    shutdown_encode_pool
 )
-import tempfile # For creating temporary directories
-import os
+
+# Use logging instead of bare prints so output from concurrently processed
+# PDFs stays readable (each line is tagged with the worker process name).
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(processName)s] %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+def process_one_pdf(pdf_name, pdf_input_folder, final_output_folder):
+    """
+    Processes a single PDF end-to-end (convert, OCR, save text).
+
+    Returns:
+        tuple: (pdf_name, status, error) where status is one of
+               'success', 'skipped' or 'error', and error is a message or None.
+    """
+    logger.info(f"--- Starting processing for '{pdf_name}' ---")
+
+    pdf_path = os.path.join(pdf_input_folder, pdf_name)
+
+    # Determine the final output path for this document's text
+    output_filename_base = os.path.splitext(pdf_name)[0]
+    final_output_path = os.path.join(final_output_folder, f"{output_filename_base}.txt")
+
+    # Skip if the output file already exists (to prevent re-processing)
+    if os.path.exists(final_output_path):
+        logger.info(f"SKIPPED: Output file '{os.path.basename(final_output_path)}' already exists. Skipping '{pdf_name}'.")
+        return (pdf_name, 'skipped', None)
+
+    try:
+        # Process the PDF: pages are rendered in memory, OCR'd, and the
+        # extracted text is streamed straight into the output file batch by
+        # batch, so the whole document never has to fit in RAM.
+        process_large_pdf(pdf_path, final_output_path)
+        logger.info(f"SUCCESS: Final extracted text saved to: {final_output_path}")
+        return (pdf_name, 'success', None)
+
+    except ValueError as e:
+        logger.warning(f"SKIPPED: OCR failed for '{pdf_name}' due to content restriction or invalid response: {e}")
+        logger.warning(f"This PDF was likely flagged for copyrighted or highly sensitive material by the AI model. "
+                       f"No output file generated for this document.")
+        # No output file created for this PDF in case of ValueError
+        return (pdf_name, 'skipped', str(e))
+
+    except Exception as e: # Catch any other unexpected errors
+        logger.error(f"ERROR: An unexpected error occurred while processing '{pdf_name}': {e}")
+        logger.error(f"No output file generated for this document due to an unexpected error.")
+        return (pdf_name, 'error', str(e))
+
+    finally:
+        # This function runs inside a process-pool worker; the encode pool's
+        # children must be shut down explicitly or the worker hangs on exit
+        # waiting to join them (atexit hooks don't run on that exit path).
+        shutdown_encode_pool()
 
 def main():
     # Define your input and output directories
@@ -14,55 +71,59 @@ def main():
     # Ensure output base directory exists
     os.makedirs(final_output_folder, exist_ok=True)
 
-    # List all PDF files in the input folder
-    pdf_files = [f for f in os.listdir(pdf_input_folder) if f.lower().endswith('.pdf')]
+    # List all PDF files in the input folder. scandir avoids a stat call
+    # per entry, which matters for folders holding tens of thousands of
+    # files. Matching stays case-insensitive so mixed-case extensions like
+    # '.Pdf' are still picked up.
+    with os.scandir(pdf_input_folder) as entries:
+        pdf_files = [e.name for e in entries
+                     if e.is_file() and e.name.lower().endswith('.pdf')]
 
     if not pdf_files:
-        print(f"No PDF files found in the '{pdf_input_folder}' directory. Please place your PDFs there.")
+        logger.info(f"No PDF files found in the '{pdf_input_folder}' directory. Please place your PDFs there.")
         return
 
-    print(f"Found {len(pdf_files)} PDF(s) to process.")
+    logger.info(f"Found {len(pdf_files)} PDF(s) to process.")
 
-    for pdf_name in pdf_files:
-        print(f"\n--- Starting processing for '{pdf_name}' ---")
+    # Drop PDFs whose output already exists in the same pass, so already-
+    # done documents never occupy a worker slot.
+    with os.scandir(final_output_folder) as entries:
+        existing_outputs = {e.name for e in entries if e.is_file()}
 
-        pdf_path = os.path.join(pdf_input_folder, pdf_name)
-        
-        # Determine the final output path for this document's text
-        output_filename_base = os.path.splitext(pdf_name)[0]
-        final_output_path = os.path.join(final_output_folder, f"{output_filename_base}.txt")
+    skipped = [f for f in pdf_files
+               if f"{os.path.splitext(f)[0]}.txt" in existing_outputs]
+    pdf_files = [f for f in pdf_files if f not in skipped]
+    for pdf_name in skipped:
+        logger.info(f"SKIPPED: Output for '{pdf_name}' already exists.")
 
-        # Skip if the output file already exists (to prevent re-processing)
-        if os.path.exists(final_output_path):
-            print(f"SKIPPED: Output file '{os.path.basename(final_output_path)}' already exists. Skipping '{pdf_name}'.")
-            continue
-
-        # Create a temporary directory for images for the current PDF
-        # This ensures unique temporary folders for each PDF and easy cleanup
-        try:
-            with tempfile.TemporaryDirectory() as temp_images_dir:
-                print(f"Using temporary image directory: {temp_images_dir}")
+    if not pdf_files:
+        logger.info("All PDFs already have output files; nothing to do.")
+        return
 
-                # Step 1: Process the PDF (converts to images, OCRs in a single call, cleans images)
-                extracted_text = process_large_pdf(pdf_path, temp_images_dir)
+    # Process several PDFs concurrently. The worker count is deliberately
+    # small (default 4) so we don't exhaust API quota or open-file limits;
+    # override with the PDF_WORKERS env var.
+    pdf_workers = max(1, min(int(os.getenv('PDF_WORKERS', '4')), len(pdf_files)))
+    worker = partial(process_one_pdf,
+                     pdf_input_folder=pdf_input_folder,
+                     final_output_folder=final_output_folder)
 
-                # Step 2: Save the final extracted text to the flat output folder
-                with open(final_output_path, 'w', encoding='utf-8') as f:
-                    f.write(extracted_text)
-                print(f"SUCCESS: Final extracted text saved to: {final_output_path}")
+    results = [(pdf_name, 'skipped', None) for pdf_name in skipped]
+    with ProcessPoolExecutor(max_workers=pdf_workers) as executor:
+        results.extend(executor.map(worker, pdf_files))
 
-        except ValueError as e:
-            print(f"SKIPPED: OCR failed for '{pdf_name}' due to content restriction or invalid response: {e}")
-            print(f"This PDF was likely flagged for copyrighted or highly sensitive material by the AI model. "
-                  f"No output file generated for this document.")
-            # No output file created for this PDF in case of ValueError
+    logger.info("--- All PDF OCR attempts completed. ---")
 
-        except Exception as e: # Catch any other unexpected errors
-            print(f"ERROR: An unexpected error occurred while processing '{pdf_name}': {e}")
-            print(f"No output file generated for this document due to an unexpected error.")
+    # Final summary so the outcome of each PDF is visible in one place
+    # even when the per-PDF logs are interleaved.
+    logger.info("Summary:")
+    for pdf_name, status, error in results:
+        if error:
+            logger.info(f"  {status.upper():8s} {pdf_name} ({error})")
+        else:
+            logger.info(f"  {status.upper():8s} {pdf_name}")
 
-    print("\n--- All PDF OCR attempts completed. ---")
-    print(f"Check the '{final_output_folder}' directory for successfully processed text files.")
+    logger.info(f"Check the '{final_output_folder}' directory for successfully processed text files.")
 
 if __name__ == "__main__":
     main()
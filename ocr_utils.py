@@ -1,104 +1,349 @@
 import os
+import time # For retry backoff sleeps
+import random # For retry jitter
+import hashlib # For content-hash cache keys
+import sqlite3 # For the local OCR result cache
+import asyncio # For concurrent Gemini batch calls
+import concurrent.futures # For the image-encoding process pool
+from dataclasses import dataclass, field # For the per-document OCRJob record
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions # For retryable API error types
 from dotenv import load_dotenv
-from pdf2image import convert_from_path
-from PIL import Image
-import shutil # Import shutil for removing directories
+import pymupdf # In-process PDF rasterizer (no poppler subprocess needed)
+from PIL import Image, features
 import json # Import json for pretty printing
 import io # Import io for in-memory byte streams
 
-# Load the API key from the .env file
-load_dotenv()
-api_key = os.getenv('GOOGLE_API_KEY')
+@dataclass
+class OCRJob:
+    """
+    Per-document artifacts shared between the OCR, verification and any
+    later passes, so each stage reuses the already-encoded page images and
+    batch texts instead of re-reading and re-encoding from the PDF.
+
+    page_parts / page_hashes cover the OCR'd pages; pages that used the
+    embedded text layer appear in embedded_texts instead and are only
+    rendered on demand (see verify_ocr_quality).
+    """
+    pdf_path: str
+    embedded_texts: dict = field(default_factory=dict)  # page number -> text-layer text
+    page_parts: dict = field(default_factory=dict)      # page number -> encoded image part
+    page_hashes: dict = field(default_factory=dict)     # page number -> sha256 of encoded bytes
+    batch_pages: list = field(default_factory=list)     # batch index -> page numbers
+    batch_texts: list = field(default_factory=list)     # batch index -> extracted text
+
+    def text_for_page(self, page_number):
+        """
+        Returns the extracted text covering a page: the embedded text layer
+        if one was used, otherwise the text of the OCR batch containing it.
+        """
+        if page_number in self.embedded_texts:
+            return self.embedded_texts[page_number]
+        for pages, text in zip(self.batch_pages, self.batch_texts):
+            if page_number in pages:
+                return text
+        return None
+
+# WebP compresses document scans 30-50% smaller than JPEG at equivalent
+# quality and Gemini accepts it; fall back to JPEG if Pillow was built
+# without the WebP encoder.
+_WEBP_AVAILABLE = features.check('webp')
+
+# The Gemini client is created lazily rather than at import time: importing
+# this module (tests, --help, etc.) shouldn't require credentials, and each
+# ProcessPoolExecutor worker must build its own client instead of inheriting
+# the parent's connection state.
+_model = None
+
+def _get_model():
+    global _model
+    if _model is None:
+        # Load the API key from the .env file and configure the Gemini API
+        load_dotenv()
+        genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
+        # Model name is overridable so upgrades don't need a code change
+        _model = genai.GenerativeModel(os.getenv('GEMINI_MODEL', 'gemini-1.5-flash'))
+    return _model
+
+# Errors worth retrying: rate limits (429), server-side failures (500/503)
+# and plain timeouts. A ValueError from response.text (safety block) is
+# deliberately NOT in this list - retrying a safety block just burns quota.
+_RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,    # 429 rate limit
+    google_exceptions.InternalServerError,  # 500
+    google_exceptions.ServiceUnavailable,   # 503
+    google_exceptions.DeadlineExceeded,     # request timeout
+    TimeoutError,
+)
+
+# Local OCR result cache. Re-running on a corpus (or on a PDF where only a
+# few pages changed) should not re-send identical pixels to Gemini: results
+# are keyed by (model, prompt, image pixels), so a prompt or model change
+# invalidates old entries automatically. Set GEMINI_OCR_CACHE to relocate
+# the database, or to an empty string to disable caching.
+_CACHE_PATH = os.getenv('GEMINI_OCR_CACHE', '.ocr_cache.sqlite')
+
+def _cache_connect():
+    # One short-lived connection per call keeps this safe across the thread
+    # pool without sharing a connection object between threads.
+    conn = sqlite3.connect(_CACHE_PATH)
+    conn.execute("CREATE TABLE IF NOT EXISTS ocr_cache (key TEXT PRIMARY KEY, text TEXT)")
+    return conn
+
+def _cache_key(prompt, image_parts):
+    """
+    Builds a stable cache key from the model name, the full prompt and the
+    encoded bytes of every image part in the batch.
+    """
+    h = hashlib.sha256()
+    h.update(_get_model().model_name.encode('utf-8'))
+    h.update(prompt.encode('utf-8'))
+    for part in image_parts:
+        h.update(part['mime_type'].encode('utf-8'))
+        h.update(part['data'])
+    return h.hexdigest()
+
+def _cache_get(key):
+    if not _CACHE_PATH:
+        return None
+    try:
+        with _cache_connect() as conn:
+            row = conn.execute("SELECT text FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+    except sqlite3.Error as e:
+        print(f"  [CACHE_DEBUG] WARNING: cache lookup failed ({e}); proceeding without cache.")
+        return None
+
+def _cache_put(key, text):
+    if not _CACHE_PATH:
+        return
+    try:
+        with _cache_connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO ocr_cache (key, text) VALUES (?, ?)", (key, text))
+    except sqlite3.Error as e:
+        print(f"  [CACHE_DEBUG] WARNING: cache write failed ({e}); result not cached.")
 
-# Configure the Gemini API with your key
-genai.configure(api_key=api_key)
+def _suggested_retry_wait(error):
+    """
+    Extracts the server-suggested retry delay in seconds from a retryable
+    exception, or None if it carries none.
 
-# Initialize the Gemini 1.5 Flash model
-model = genai.GenerativeModel('gemini-1.5-flash')
+    retry_delay is typically a protobuf Duration; its seconds field can
+    legitimately be 0 (a sub-second suggestion) and a Duration itself is
+    not float()-able, so check 'is not None' explicitly rather than
+    truthiness and never let coercion errors escape the retry loop.
+    """
+    retry_delay = getattr(error, 'retry_delay', None)
+    if retry_delay is None:
+        return None
+    seconds = getattr(retry_delay, 'seconds', None)
+    try:
+        return float(seconds) if seconds is not None else float(retry_delay)
+    except (TypeError, ValueError):
+        return None
 
-def convert_pdf_to_images(pdf_path, output_folder, dpi=300):
+def _call_gemini(content, max_attempts=6, initial_wait=2, max_wait=60):
+    """
+    Calls model.generate_content with exponential backoff + jitter for
+    transient errors (429 rate limits, 5xx, timeouts).
+
+    Now that batches run concurrently, a rate-limit burst is expected
+    behaviour rather than an exception - without retries a single 429 would
+    throw away a whole batch (and the whole PDF).
+    """
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return _get_model().generate_content(content)
+        except _RETRYABLE_ERRORS as e:
+            if attempt == max_attempts:
+                print(f"  [RETRY_DEBUG] Giving up after {max_attempts} attempts: {e}")
+                raise
+            # Honor the server-suggested delay if the exception carries one,
+            # otherwise back off exponentially with full jitter.
+            wait = _suggested_retry_wait(e)
+            if wait is None:
+                wait = random.uniform(0, min(max_wait, initial_wait * (2 ** (attempt - 1))))
+            print(f"  [RETRY_DEBUG] Attempt {attempt} failed with {type(e).__name__}: {e}. "
+                  f"Retrying in {wait:.1f}s...")
+            time.sleep(wait)
+
+async def _call_gemini_async(content, max_attempts=6, initial_wait=2, max_wait=60):
     """
-    Converts each page of a PDF file into a high-resolution image, saving directly as JPEG.
+    Async counterpart of _call_gemini with the same retry policy, sleeping
+    with asyncio.sleep so other in-flight batches keep running.
+    """
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return await _get_model().generate_content_async(content)
+        except _RETRYABLE_ERRORS as e:
+            if attempt == max_attempts:
+                print(f"  [RETRY_DEBUG] Giving up after {max_attempts} attempts: {e}")
+                raise
+            wait = _suggested_retry_wait(e)
+            if wait is None:
+                wait = random.uniform(0, min(max_wait, initial_wait * (2 ** (attempt - 1))))
+            print(f"  [RETRY_DEBUG] Attempt {attempt} failed with {type(e).__name__}: {e}. "
+                  f"Retrying in {wait:.1f}s...")
+            await asyncio.sleep(wait)
+
+# Gemini Flash resizes images to <=768px tiles internally, so uploading
+# 300 DPI scans just wastes bandwidth and vision tokens. 150 DPI plus the
+# max_edge downsize in ocr_with_gemini is plenty for ordinary documents;
+# bump dpi/max_edge for documents where small digits matter (see
+# ocr_financial_document).
+def convert_pdf_to_images(pdf_path, dpi=150, first_page=None, last_page=None, pages=None):
+    """
+    Converts PDF pages into high-resolution in-memory images using PyMuPDF.
+
+    PyMuPDF renders in-process (no pdftoppm subprocess to fork per call) and
+    releases the GIL while rendering, so the thread pool in
+    process_large_pdf parallelizes rasterization cleanly. Each call opens
+    its own document handle, which sidesteps MuPDF's internal locks when
+    several batches render concurrently.
+
+    first_page/last_page (1-based, inclusive) allow rendering just one batch
+    of pages at a time so huge PDFs never need to fit in memory at once.
+    pages takes precedence and renders an explicit (possibly non-contiguous)
+    list of 1-based page numbers, which the hybrid text-layer path needs.
 
     Args:
         pdf_path (str): The file path of the PDF.
-        output_folder (str): The directory to save the output images.
         dpi (int): The resolution (dots per inch) for the output images.
+        first_page (int): First page to render (1-based), or None for page 1.
+        last_page (int): Last page to render (inclusive), or None for the end.
+        pages (list): Explicit 1-based page numbers to render, or None.
 
     Returns:
-        list: A list of file paths for the created images.
+        list: A list of PIL.Image objects, one per rendered page.
     """
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
+    images = []
+    with pymupdf.open(pdf_path) as doc:
+        if pages is None:
+            start = (first_page or 1) - 1
+            stop = last_page if last_page is not None else doc.page_count
+            page_indices = range(start, min(stop, doc.page_count))
+        else:
+            page_indices = [p - 1 for p in pages if 1 <= p <= doc.page_count]
+        for page_number in page_indices:
+            pix = doc[page_number].get_pixmap(dpi=dpi)
+            images.append(Image.frombytes('RGB', (pix.width, pix.height), pix.samples))
+
+    print(f"  [PDF_DEBUG] Rendered {len(images)} page(s) in memory.")
 
-    # --- REVISED IMAGE CONVERSION START ---
-    # Directly instruct convert_from_path to save as JPEG and return paths
-    # This is the most reliable way to ensure the desired format.
-    image_paths = convert_from_path(
-        pdf_path,
-        dpi=dpi,
-        output_folder=output_folder, # Tell it where to save the files
-        fmt='jpeg',                  # Tell it to save as JPEG
-        paths_only=True              # Tell it to return the paths it saved
-    )
-    # --- REVISED IMAGE CONVERSION END ---
+    return images
 
-    # Add a debug print to confirm the generated paths are JPEGs
-    print(f"  [PDF_DEBUG] pdf2image generated paths (first 5): {[os.path.basename(p) for p in image_paths[:5]]}")
+def _mostly_ascii(text, threshold=0.7):
+    """
+    Heuristic for a usable embedded text layer: garbled extractions from
+    scanned PDFs tend to be dominated by non-ASCII artifacts.
+    """
+    if not text:
+        return False
+    ascii_count = sum(1 for ch in text if ord(ch) < 128)
+    return ascii_count / len(text) >= threshold
 
-    return image_paths
+def extract_text_layer(pdf_path):
+    """
+    Pulls the embedded text layer from a born-digital PDF.
 
-def batch_images(image_paths, batch_size=100):
+    Returns a dict of {page_number (1-based): text} covering only the pages
+    whose extracted text looks usable (more than 50 characters and mostly
+    ASCII). Pages missing from the dict need image-based OCR.
+    """
+    texts = {}
+    with pymupdf.open(pdf_path) as doc:
+        for i, page in enumerate(doc, start=1):
+            text = page.get_text('text')
+            if len(text.strip()) > 50 and _mostly_ascii(text):
+                texts[i] = text
+    return texts
+
+def get_pdf_page_count(pdf_path):
     """
-    Yields successive n-sized chunks from a list of image paths.
+    Returns the number of pages in a PDF without rendering anything.
     """
-    for i in range(0, len(image_paths), batch_size):
-        yield image_paths[i:i + batch_size]
+    with pymupdf.open(pdf_path) as doc:
+        return doc.page_count
 
-def ocr_with_gemini(image_paths, instruction_prefix=""):
+def batch_images(items, batch_size=8):
     """
-    Performs OCR on a list of images using Gemini 1.5 Flash.
+    Yields successive n-sized chunks from a list (page numbers or images).
 
-    Args:
-        image_paths (list): A list of file paths for the images to process.
-        instruction_prefix (str): An optional prefix for specific instructions.
+    The default of 8 keeps each Gemini request small: less image data per
+    call, fewer output-token truncations, and a single safety block only
+    costs 8 pages of work instead of a large batch.
+    """
+    for i in range(0, len(items), batch_size):
+        yield items[i:i + batch_size]
 
-    Returns:
-        str: The extracted text from the images.
+def _encode_image(img):
     """
-    images_for_gemini = []
-    for path in image_paths:
-        # --- DEBUGGING START ---
-        print(f"  [OCR_DEBUG] Attempting to open path for Gemini API: {path}")
-        if not os.path.exists(path):
-            print(f"  [OCR_DEBUG] WARNING: Image file does not exist at path: {path}. Skipping.")
-            continue
-        if not path.lower().endswith(('.jpg', '.jpeg', '.png')): # Also check for PNG just in case
-            print(f"  [OCR_DEBUG] WARNING: Unexpected image extension '{os.path.splitext(path)[1]}' for path: {path}. Expected .jpg/.png.")
-        # --- DEBUGGING END ---
+    Compresses one prepared PIL image into an inline part for the API.
 
+    WebP at quality 80 is markedly smaller than the JPEG the SDK would
+    otherwise upload; that directly cuts per-batch upload time.
+    """
+    buf = io.BytesIO()
+    if _WEBP_AVAILABLE:
+        img.save(buf, 'WEBP', quality=80, method=6)
+        mime_type = 'image/webp'
+    else:
+        img.save(buf, 'JPEG', quality=85, optimize=True)
+        mime_type = 'image/jpeg'
+    return {'mime_type': mime_type, 'data': buf.getvalue()}
+
+def _prepare_images(images, max_edge):
+    """
+    Normalizes a batch of PIL images for upload (RGB mode, downsized) and
+    compresses each into an inline {'mime_type', 'data'} part.
+    """
+    images_for_gemini = []
+    for img in images:
         try:
-            img = Image.open(path)
             # Ensure image is in RGB mode, as some APIs prefer it
             if img.mode != 'RGB':
                 img = img.convert('RGB')
-            images_for_gemini.append(img)
+            # Downsize before upload - Gemini gains nothing from pixels
+            # beyond its internal tile size.
+            if max(img.size) > max_edge:
+                img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            images_for_gemini.append(_encode_image(img))
         except Exception as img_err:
-            print(f"  [OCR_DEBUG] ERROR: Could not open/process image '{path}': {img_err}. Skipping this image.")
+            print(f"  [OCR_DEBUG] ERROR: Could not process image: {img_err}. Skipping this image.")
             # We don't raise here, we just skip the problematic image in the batch
             # If all images in a batch fail, images_for_gemini will be empty and handled below.
             continue
+    return images_for_gemini
 
+# Resize + WebP compression is pure CPU work; done inline it would block
+# the event loop and serialize with the network calls. A process pool lets
+# encoding of the next batch overlap with uploads of the current one.
+# Created lazily so merely importing this module stays cheap.
+_encode_pool = None
 
-    # --- DEBUGGING START ---
-    print(f"  [OCR_DEBUG] Processing batch with {len(images_for_gemini)} images (after loading/conversion).")
-    if not images_for_gemini:
-        print("  [OCR_DEBUG] WARNING: No valid images to send to Gemini in this batch! Returning empty string.")
-        return ""
-    # --- DEBUGGING END ---
+def _get_encode_pool():
+    global _encode_pool
+    if _encode_pool is None:
+        _encode_pool = concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count())
+    return _encode_pool
 
-    prompt = f"""
+def shutdown_encode_pool():
+    """
+    Shuts down the encode pool's worker processes.
+
+    Callers that run inside a multiprocessing worker (like process_one_pdf
+    under main()'s ProcessPoolExecutor) MUST call this before the worker
+    exits: concurrent.futures' atexit shutdown hook does not run on the
+    multiprocessing child's exit path, so the encode children never get
+    their shutdown sentinel and the worker hangs forever joining them.
+    """
+    global _encode_pool
+    if _encode_pool is not None:
+        _encode_pool.shutdown()
+        _encode_pool = None
+
+def _build_ocr_prompt(instruction_prefix):
+    return f"""
     {instruction_prefix}
 
     Extract ALL text content from the following document pages.
@@ -114,71 +359,181 @@ def ocr_with_gemini(image_paths, instruction_prefix=""):
     -   The output should be the complete and exact text content of the document.
     """
 
-    content = [prompt, *images_for_gemini] # Use the prepared images_for_gemini list
+def _debug_response(response):
+    # --- DEBUGGING START ---
+    print(f"  [OCR_DEBUG] Raw response object (first candidate):")
+    first_candidate = None
+    if response.candidates:
+        first_candidate = response.candidates[0]
+        print(f"    Finish Reason: {first_candidate.finish_reason.name if first_candidate.finish_reason else 'N/A'}")
+        if first_candidate.safety_ratings:
+            print("    Safety Ratings:")
+            for rating in first_candidate.safety_ratings:
+                print(f"      - {rating.category.name}: {rating.probability.name}")
+        if first_candidate.content:
+            print(f"    Content Parts (text): {len([p for p in first_candidate.content.parts if p.text])}")
+        else:
+            print("    No content in first candidate.")
+    else:
+        print("    No candidates returned in response.")
+
+    if response.usage_metadata:
+        print(f"  [OCR_DEBUG] Token counts: Input={response.usage_metadata.prompt_token_count}, Output={response.usage_metadata.candidates_token_count}, Total={response.usage_metadata.total_token_count}")
+
+    if first_candidate and first_candidate.finish_reason.name == 'MAX_OUTPUT_TOKENS':
+        print(f"  [OCR_DEBUG] WARNING: Output truncated due to MAX_OUTPUT_TOKENS limit for this batch.")
+        print(f"  [OCR_DEBUG] Consider reducing batch size or simplifying prompt if this is a recurring issue.")
+    # --- DEBUGGING END ---
 
+def _extract_response_text(response, cache_key):
     try:
-        response = model.generate_content(content)
-
-        # --- DEBUGGING START ---
-        print(f"  [OCR_DEBUG] Raw response object (first candidate):")
-        if response.candidates:
-            first_candidate = response.candidates[0]
-            print(f"    Finish Reason: {first_candidate.finish_reason.name if first_candidate.finish_reason else 'N/A'}")
-            if first_candidate.safety_ratings:
-                print("    Safety Ratings:")
-                for rating in first_candidate.safety_ratings:
-                    print(f"      - {rating.category.name}: {rating.probability.name}")
-            if first_candidate.content:
-                print(f"    Content Parts (text): {len([p for p in first_candidate.content.parts if p.text])}")
-                print(f"    Content Parts (text): {len([p for p in first_candidate.content.parts if p.text])}")
-            else:
-                print("    No content in first candidate.")
-        else:
-            print("    No candidates returned in response.")
-        # --- DEBUGGING END ---
-
-        # --- DEBUGGING START ---
-        if response.usage_metadata:
-            print(f"  [OCR_DEBUG] Token counts: Input={response.usage_metadata.prompt_token_count}, Output={response.usage_metadata.candidates_token_count}, Total={response.usage_metadata.total_token_count}")
-        
-        if response.candidates and first_candidate.finish_reason.name == 'MAX_OUTPUT_TOKENS':
-            print(f"  [OCR_DEBUG] WARNING: Output truncated due to MAX_OUTPUT_TOKENS limit for this batch.")
-            print(f"  [OCR_DEBUG] Consider reducing batch size or simplifying prompt if this is a recurring issue.")
-        # --- DEBUGGING END ---
-
-        return response.text
+        _debug_response(response)
+        extracted_text = response.text
+        _cache_put(cache_key, extracted_text)
+        return extracted_text
     except ValueError as e:
         print(f"  [OCR_DEBUG] ERROR: ValueError when trying to get response.text in ocr_with_gemini. Error: {e}")
         raise e
-    except Exception as e:
-        print(f"  [OCR_DEBUG] UNEXPECTED ERROR: An unexpected error occurred during model generation: {e}")
-        raise e
+
+def ocr_with_gemini(images, instruction_prefix="", max_edge=1024):
+    """
+    Performs OCR on a list of in-memory images using Gemini 1.5 Flash.
+
+    Args:
+        images (list): A list of PIL.Image objects to process.
+        instruction_prefix (str): An optional prefix for specific instructions.
+        max_edge (int): Maximum long-edge size in pixels; larger images are
+            downsized before upload to cut bandwidth and vision tokens.
+
+    Returns:
+        str: The extracted text from the images.
+    """
+    images_for_gemini = _prepare_images(images, max_edge)
+
+    # --- DEBUGGING START ---
+    print(f"  [OCR_DEBUG] Processing batch with {len(images_for_gemini)} images (after loading/conversion).")
+    if not images_for_gemini:
+        print("  [OCR_DEBUG] WARNING: No valid images to send to Gemini in this batch! Returning empty string.")
+        return ""
+    # --- DEBUGGING END ---
+
+    prompt = _build_ocr_prompt(instruction_prefix)
+
+    # Skip the API entirely when this exact (model, prompt, pixels) batch
+    # has been OCR'd before - reruns on unchanged pages become free.
+    cache_key = _cache_key(prompt, images_for_gemini)
+    cached_text = _cache_get(cache_key)
+    if cached_text is not None:
+        print(f"  [CACHE_DEBUG] Cache hit for batch of {len(images_for_gemini)} image(s); skipping Gemini call.")
+        return cached_text
+
+    content = [prompt, *images_for_gemini] # Use the prepared images_for_gemini list
+    response = _call_gemini(content)
+    return _extract_response_text(response, cache_key)
+
+async def ocr_with_gemini_async(images, instruction_prefix="", max_edge=1024):
+    """
+    Async variant of ocr_with_gemini, built on generate_content_async.
+
+    Coroutines are much lighter than threads, so many batches can be
+    in flight at once without per-thread stack overhead; process_large_pdf
+    bounds the actual concurrency with a semaphore.
+    """
+    # Encode in the process pool so the CPU work overlaps with other
+    # batches' network I/O instead of blocking the event loop.
+    loop = asyncio.get_running_loop()
+    images_for_gemini = await loop.run_in_executor(
+        _get_encode_pool(), _prepare_images, images, max_edge)
+    return await ocr_parts_with_gemini_async(images_for_gemini, instruction_prefix)
+
+async def ocr_parts_with_gemini_async(image_parts, instruction_prefix=""):
+    """
+    OCRs a batch of already-encoded {'mime_type', 'data'} image parts.
+
+    Split out from ocr_with_gemini_async so callers that keep encoded parts
+    around (OCRJob, adaptive batch splitting) can resend them without
+    paying the render + encode cost again.
+    """
+    print(f"  [OCR_DEBUG] Processing batch with {len(image_parts)} images (after loading/conversion).")
+    if not image_parts:
+        print("  [OCR_DEBUG] WARNING: No valid images to send to Gemini in this batch! Returning empty string.")
+        return ""
+
+    prompt = _build_ocr_prompt(instruction_prefix)
+
+    cache_key = _cache_key(prompt, image_parts)
+    cached_text = _cache_get(cache_key)
+    if cached_text is not None:
+        print(f"  [CACHE_DEBUG] Cache hit for batch of {len(image_parts)} image(s); skipping Gemini call.")
+        return cached_text
+
+    content = [prompt, *image_parts]
+    response = await _call_gemini_async(content)
+    return _extract_response_text(response, cache_key)
 
 # Rest of ocr_utils.py remains the same:
-def ocr_complex_document(image_paths):
-    instruction_prefix = """
+_COMPLEX_LAYOUT_INSTRUCTIONS = """
     **Special emphasis for complex layouts:**
     -   Ensure accurate Markdown table recreation.
     -   Strictly maintain multi-column reading order (left-to-right, top-to-bottom).
     -   Extract all text from charts and graphs.
     """
-    return ocr_with_gemini(image_paths, instruction_prefix)
 
-def ocr_financial_document(image_paths):
-    instruction_prefix = """
+_FINANCIAL_INSTRUCTIONS = """
     **Special emphasis for financial documents:**
     -   Achieve 100% numerical accuracy, including decimals and currency symbols.
     -   Precisely transcribe financial tables into Markdown.
     -   Capture all dates and critical sections like footnotes.
     """
-    return ocr_with_gemini(image_paths, instruction_prefix)
 
-def verify_ocr_quality(image_path, extracted_text):
-    image = Image.open(image_path)
+def ocr_complex_document(images, max_edge=1024):
+    return ocr_with_gemini(images, _COMPLEX_LAYOUT_INSTRUCTIONS, max_edge=max_edge)
+
+def ocr_financial_document(images, max_edge=1536):
+    # Financial documents keep a larger max_edge (and should be rendered at
+    # ~220 DPI via convert_pdf_to_images) so small digits stay legible.
+    return ocr_with_gemini(images, _FINANCIAL_INSTRUCTIONS, max_edge=max_edge)
+
+def verify_ocr_quality(job, page_number):
+    """
+    Asks Gemini to compare one page's image against its extracted text.
+
+    Takes the OCRJob returned by process_large_pdf: OCR'd pages reuse the
+    encoded image part captured during extraction (no re-render, no
+    re-encode); pages that used the embedded text layer are rendered and
+    encoded once on demand and then cached on the job.
+
+    Raises:
+        ValueError: if the page number is not part of the job.
+    """
+    extracted_text = job.text_for_page(page_number)
+    if extracted_text is None:
+        raise ValueError(
+            f"Page {page_number} is not part of the OCR job for "
+            f"'{os.path.basename(job.pdf_path)}' (no extracted text recorded).")
+
+    image_part = job.page_parts.get(page_number)
+    if image_part is None:
+        images = convert_pdf_to_images(job.pdf_path, pages=[page_number])
+        image_part = _prepare_images(images, 1024)[0]
+        job.page_parts[page_number] = image_part
+        job.page_hashes[page_number] = hashlib.sha256(image_part['data']).hexdigest()
+
+    # OCR text is batch-granular, so for an OCR'd page the supplied text can
+    # also contain neighboring pages of the same batch; tell the model so it
+    # doesn't report that extra content as discrepancies.
+    if page_number in job.embedded_texts:
+        batch_note = ""
+    else:
+        batch_note = ("\n    **Note:** The extracted text below was produced for a batch of pages; "
+                      "it may also contain text from pages adjacent to the shown page. "
+                      "Only report problems with the portion corresponding to the shown page, "
+                      "and do NOT report the adjacent pages' text as extraneous or missing.")
+
     prompt = f"""
     **Task: OCR Quality Verification**
     You are a quality assurance analyst. I have an original document page image and the text extracted from it via OCR.
-    Your job is to compare the image with the text and report any discrepancies.
+    Your job is to compare the image with the text and report any discrepancies.{batch_note}
     **Analyze for:**
     1.  **Missing Text**: Any words, sentences, or paragraphs missing from the text.
     2.  **Incorrect Characters**: Misrecognized letters, numbers, or symbols (e.g., 'l' vs '1', 'O' vs '0').
@@ -190,30 +545,145 @@ def verify_ocr_quality(image_path, extracted_text):
     ---
     Provide a summary of any errors found. If no errors are found, respond with "No errors found."
     """
-    response = model.generate_content([prompt, image])
+    response = _get_model().generate_content([prompt, image_part])
     return response.text
 
-def process_large_pdf(pdf_path, temp_images_folder):
-    print(f"Converting '{os.path.basename(pdf_path)}' to images...")
-    # This call now uses the fixed convert_pdf_to_images which will return JPEG paths
-    image_paths = convert_pdf_to_images(pdf_path, temp_images_folder)
-
-    # --- DEBUGGING START ---
-    print(f"  [PDF_DEBUG] Temporary images saved to: {temp_images_folder}. Manual inspection is recommended.")
-    # --- DEBUGGING END ---
+async def _aocr_encoded_parts(parts, pages):
+    """
+    OCRs already-encoded parts, splitting the batch on safety rejections.
 
-    image_batches = list(batch_images(image_paths, 10)) # Using a smaller batch size (e.g., 10) to mitigate output token limits
+    Because the parts are kept, the split halves are resent directly -
+    no page is rendered or encoded twice.
+    """
+    try:
+        return await ocr_parts_with_gemini_async(parts, _COMPLEX_LAYOUT_INSTRUCTIONS)
+    except ValueError:
+        # A safety block (or empty response) poisons the whole batch even if
+        # only one page triggered it. Split the batch and retry each half so
+        # the blast radius shrinks down to the single offending page.
+        if len(pages) <= 1:
+            raise
+        mid = len(pages) // 2
+        print(f"  [OCR_DEBUG] Batch (pages {pages[0]}-{pages[-1]}) was rejected; "
+              f"splitting in half and retrying...")
+        first_half = await _aocr_encoded_parts(parts[:mid], pages[:mid])
+        second_half = await _aocr_encoded_parts(parts[mid:], pages[mid:])
+        return first_half + second_half
+
+async def _aocr_pages(pdf_path, pages, dpi=150, max_edge=1024):
+    """
+    Renders one batch of pages in memory, encodes them and OCRs the batch.
 
-    full_extracted_text = ""
+    pages is a sorted (not necessarily contiguous) list of 1-based page
+    numbers. Rendering inside the worker (rather than rendering the whole
+    PDF up front) keeps only a few batches of pages in memory at any time.
+    The CPU-bound render runs in the default thread pool so it doesn't
+    block the event loop.
 
-    for i, batch in enumerate(image_batches):
-        print(f"Processing batch {i + 1} of {len(image_batches)} for '{os.path.basename(pdf_path)}' (Pages {i*10 + 1} to {min((i+1)*10, len(image_paths))})...")
-        batch_text = ocr_complex_document(batch)
-        full_extracted_text += f"\n\n--- END OF BATCH {i + 1} ---\n\n{batch_text}"
+    Returns:
+        tuple: (encoded parts, extracted text) so the caller can stash the
+        parts on the OCRJob for later verification passes.
+    """
+    loop = asyncio.get_running_loop()
+    images = await loop.run_in_executor(
+        None, lambda: convert_pdf_to_images(pdf_path, dpi=dpi, pages=pages))
+    parts = await loop.run_in_executor(_get_encode_pool(), _prepare_images, images, max_edge)
+    text = await _aocr_encoded_parts(parts, pages)
+    return parts, text
+
+async def aprocess_large_pdf(pdf_path, output_path, dpi=150, max_edge=1024, batch_size=8):
+    """
+    OCRs a whole PDF and streams the text to output_path batch by batch.
 
-    print(f"Cleaning up temporary images for '{os.path.basename(pdf_path)}'...")
-    if os.path.exists(temp_images_folder):
-        shutil.rmtree(temp_images_folder)
-        print(f"Removed temporary image folder: {temp_images_folder}")
+    Writing each batch as soon as it (and all earlier batches) completes
+    keeps memory flat regardless of document size and leaves partial
+    results on disk if a later batch fails. The text is written to a
+    '.part' file and renamed into place at the end, so a half-finished run
+    is never mistaken for a completed output.
 
-    return full_extracted_text
+    Returns:
+        OCRJob: the per-document record (encoded page parts, hashes and
+        batch texts) for use by verify_ocr_quality and later passes.
+    """
+    page_count = get_pdf_page_count(pdf_path)
+    print(f"'{os.path.basename(pdf_path)}' has {page_count} page(s).")
+
+    # Hybrid extraction: born-digital pages carry a perfect text layer that
+    # costs nothing to read, so only pages without a usable layer (scans,
+    # image-only pages) are sent through image-based OCR.
+    embedded_texts = extract_text_layer(pdf_path)
+    ocr_pages = [p for p in range(1, page_count + 1) if p not in embedded_texts]
+    if embedded_texts:
+        print(f"  [PDF_DEBUG] {len(embedded_texts)} page(s) have an embedded text layer; "
+              f"{len(ocr_pages)} page(s) need OCR.")
+
+    # Batch by page number; each worker renders its own pages in memory, so
+    # nothing is written to (or re-read from) disk.
+    page_batches = list(batch_images(ocr_pages, batch_size))
+
+    # --- PARALLEL BATCH PROCESSING START ---
+    # The Gemini calls are network-bound, so all batches are dispatched at
+    # once as coroutines; the semaphore bounds how many are actually in
+    # flight (configurable via GEMINI_CONCURRENCY, default 8).
+    semaphore = asyncio.Semaphore(max(1, int(os.getenv('GEMINI_CONCURRENCY', '8'))))
+
+    job = OCRJob(pdf_path=pdf_path, embedded_texts=embedded_texts,
+                 batch_pages=page_batches)
+
+    async def run_batch(i, pages):
+        async with semaphore:
+            print(f"Starting batch {i + 1} of {len(page_batches)} for '{os.path.basename(pdf_path)}' (Pages {pages[0]} to {pages[-1]})...")
+            parts, batch_text = await _aocr_pages(pdf_path, pages, dpi, max_edge)
+            # Stash the encoded parts so verification (or any later pass)
+            # reuses them instead of re-rendering the PDF. Skipped pages
+            # would misalign the zip, so only record complete batches.
+            if len(parts) == len(pages):
+                for page_number, part in zip(pages, parts):
+                    job.page_parts[page_number] = part
+                    job.page_hashes[page_number] = hashlib.sha256(part['data']).hexdigest()
+            print(f"Finished batch {i + 1} of {len(page_batches)} for '{os.path.basename(pdf_path)}'.")
+            return batch_text
+
+    tasks = [asyncio.ensure_future(run_batch(i, pages))
+             for i, pages in enumerate(page_batches)]
+
+    # Interleave embedded-text pages and OCR batches back into page order.
+    # Each unit is keyed by the first page it covers; batches were built
+    # from sorted page numbers, so sorting the units keeps batch order too.
+    units = [('embedded', page_number) for page_number in embedded_texts]
+    units += [('ocr', i) for i in range(len(page_batches))]
+    units.sort(key=lambda unit: unit[1] if unit[0] == 'embedded' else page_batches[unit[1]][0])
+
+    partial_path = f"{output_path}.part"
+    try:
+        # A large write buffer batches the flushed text into few syscalls.
+        with open(partial_path, 'w', encoding='utf-8', buffering=1 << 20) as out_file:
+            # Await in batch order: every batch is already running, but its
+            # text hits the disk as soon as all earlier batches are written.
+            for kind, key in units:
+                if kind == 'embedded':
+                    out_file.write(f"\n\n--- PAGE {key} (embedded text) ---\n\n{embedded_texts[key]}")
+                else:
+                    batch_text = await tasks[key]
+                    out_file.write(f"\n\n--- END OF BATCH {key + 1} ---\n\n{batch_text}")
+                out_file.flush()
+    except BaseException:
+        # Don't leave stray .part files behind on failure/cancellation.
+        for task in tasks:
+            task.cancel()
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    # --- PARALLEL BATCH PROCESSING END ---
+
+    os.replace(partial_path, output_path)
+
+    # All tasks have resolved by now (the writer awaited each in order).
+    job.batch_texts = [task.result() for task in tasks]
+    return job
+
+def process_large_pdf(pdf_path, output_path, dpi=150, max_edge=1024, batch_size=8):
+    """
+    Synchronous entry point; runs the async pipeline in a fresh event loop.
+    """
+    return asyncio.run(aprocess_large_pdf(pdf_path, output_path, dpi=dpi, max_edge=max_edge, batch_size=batch_size))